@@ -34,6 +34,10 @@ def status():
     """
     Get the status of the app.
 
+    Pass ?force=true to check whether the running tasks are done right away instead of
+    waiting for config.taskPollInterval to pass since the last check. The celery task
+    completion callback uses this.
+
     :return:
     object
         message
@@ -69,7 +73,8 @@ def status():
                 error
                     A system error has occurred.
     """
-    return jsonify(recipes.status())
+    force = request.args.get('force') == 'true'
+    return app.response_class(recipes.statusJson(force), mimetype='application/json')
 
 
 @app.route('/start/<name>')
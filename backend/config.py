@@ -1,4 +1,5 @@
 from os import environ
+from os.path import expanduser
 """
 This is the config file. See the comments for each option.
 """
@@ -7,6 +8,10 @@ This is the config file. See the comments for each option.
 # Where the recipe files are located. You should never need to change this.
 recipesPackage = environ.get("RECIPES_PACKAGE", 'recipes.files')  
 
+# Where compiled recipe plans are cached so recipe files don't have to be parsed again after
+# a restart. Safe to delete at any time.
+planCacheDir = environ.get("PLAN_CACHE_DIR", expanduser('~/.cache/microlab/plans'))
+
 
 ## FLASK CONFIGURATION ##
 
@@ -23,6 +28,12 @@ localUrl = 'http://%s:%s' % (apiHost, apiPort)
 # Speeds up every task for testing hardware. Should be set to 1 for actual use
 hardwareSpeedup = environ.get("HARDWARE_SPEEDUP", 1)  
 
+# Optional. Maximum CPU wakeup latency in microseconds requested through /dev/cpu_dma_latency
+# while a task is timing a temperature or stirring window. This keeps the whole system out of
+# deep idle states for the length of the window, which costs idle power, so it is off (-1)
+# by default. Only enable it if the control loop is seen waking up late.
+cpuLatencyLimit = int(environ.get("CPU_LATENCY_LIMIT", -1))
+
 # Which hardware board the software is being run on, for loading known hardware configuration. 
 # supported values:
 # pi, AML-S905X-CC-V1.0A, custom
@@ -38,6 +49,10 @@ hardwareBoard = environ.get("HARDWARE_BOARD", "pi")
 # only useful for testing
 celeryMode = environ.get("CELERY_MODE", 'real')     
 
+# Minimum number of seconds between two checks with celery whether the tasks of the
+# running recipe step are done. Status requests in between reuse the last answer.
+taskPollInterval = float(environ.get("TASK_POLL_INTERVAL", 0.25))
+
 redisHost = environ.get("REDIS_HOST", 'localhost')  
 redisPort = environ.get("REDIS_PORT", 6379)  
 
@@ -7,7 +7,11 @@ for the module, as well as adding a call to that for a unique string setting to
 file.
 """
 
+import os
+import struct
+import collections
 import time
+import threading
 import config
 import hardware.reagentdispenser as rd
 import hardware.stirring as stirring
@@ -62,6 +66,117 @@ def sleep(seconds):
     time.sleep(seconds)
 
 
+_latencyLock = threading.Lock()
+_latencyFd = None
+_latencyHolders = 0
+# Set when the device couldn't be opened, so the nested requests of a maintain or stir loop
+# don't retry on every iteration. Cleared once the last request is dropped.
+_latencyFailed = False
+
+
+def holdLowLatency():
+    """
+    Ask the kernel to keep the CPU out of deep idle states, by writing config.cpuLatencyLimit
+    to /dev/cpu_dma_latency. The request stays active until every holdLowLatency() call has
+    been matched by a releaseLowLatency() call. Does nothing if config.cpuLatencyLimit is
+    negative or if the device is not available, for example when not running as root.
+
+    :return:
+        None
+    """
+    global _latencyFd, _latencyHolders, _latencyFailed
+    with _latencyLock:
+        _latencyHolders = _latencyHolders + 1
+        if _latencyFd is not None or _latencyFailed or config.cpuLatencyLimit < 0:
+            return
+        try:
+            fd = os.open('/dev/cpu_dma_latency', os.O_WRONLY)
+        except OSError:
+            _latencyFailed = True
+            return
+        try:
+            os.write(fd, struct.pack('i', config.cpuLatencyLimit))
+        except OSError:
+            os.close(fd)
+            _latencyFailed = True
+            return
+        _latencyFd = fd
+
+
+def releaseLowLatency():
+    """
+    Drop a request made with holdLowLatency(). The CPU is allowed back into deep idle
+    states once the last request is dropped.
+
+    :return:
+        None
+    """
+    global _latencyFd, _latencyHolders, _latencyFailed
+    with _latencyLock:
+        _latencyHolders = _latencyHolders - 1
+        if _latencyHolders == 0:
+            if _latencyFd is not None:
+                os.close(_latencyFd)
+                _latencyFd = None
+            _latencyFailed = False
+
+
+def ioSleep(seconds):
+    """
+    Same as sleep() but, if config.cpuLatencyLimit is set, keeps the CPU out of deep idle
+    states while sleeping so the caller wakes up close to the requested time. See
+    holdLowLatency(). Meant for loops timing the hardware, such as maintaining a temperature.
+    Wrap the whole loop in holdLowLatency()/releaseLowLatency() to avoid re-requesting the
+    latency limit on every iteration.
+
+    :param seconds:
+    Number of seconds to sleep. In real life will actually sleep for seconds/config.hardwareSpeedup.
+
+    :return:
+    None
+    """
+    holdLowLatency()
+    try:
+        sleep(seconds)
+    finally:
+        releaseLowLatency()
+
+
+_commandQueue = collections.deque()
+
+
+def queueCommand(command, *args):
+    """
+    Queue a hardware command to be run on the next flushCommands() call instead of right away.
+    Lets a control loop decide on all its commands first and send them together at a single
+    point in its cycle.
+
+    :param command:
+        The hardware function to call, e.g. turnHeaterOn
+    :param args:
+        Arguments to call the function with.
+    :return:
+        None
+    """
+    _commandQueue.append((command, args))
+
+
+def flushCommands():
+    """
+    Run all the commands queued with queueCommand() in the order they were queued. A command
+    identical to the one right before it is only run once.
+
+    :return:
+        None
+    """
+    last = None
+    while len(_commandQueue) > 0:
+        command = _commandQueue.popleft()
+        if command != last:
+            command[0](*command[1])
+            last = command
+
+
 def turnHeaterOn():
     """
     Start heating the jacket.
@@ -134,6 +249,81 @@ def getTemp():
     return tempController.getTemp()
 
 
+# Shared temperature sampler used by waitForTemp(). A single background thread reads the
+# sensor and only wakes the waiting tasks once one of their conditions is actually met.
+tempSampleInterval = 0.5
+currentTemp = None
+_tempCondition = threading.Condition()
+_tempWaiters = []
+_tempSampler = None
+_tempError = None
+
+
+def _sampleTemp():
+    """
+    Body of the temperature sampler thread. Reads the temperature every tempSampleInterval
+    seconds for as long as somebody is waiting on it and notifies the waiters when one of
+    their predicates holds for the new reading. If reading the sensor fails the error is
+    handed over to the waiters.
+
+    :return:
+        None
+    """
+    global currentTemp, _tempSampler, _tempError
+    while True:
+        try:
+            temp = getTemp()
+        except Exception as e:
+            with _tempCondition:
+                _tempError = e
+                _tempSampler = None
+                currentTemp = None
+                _tempCondition.notify_all()
+            return
+        with _tempCondition:
+            if len(_tempWaiters) == 0:
+                _tempSampler = None
+                currentTemp = None
+                return
+            currentTemp = temp
+            if any(predicate(temp) for predicate in _tempWaiters):
+                _tempCondition.notify_all()
+        sleep(tempSampleInterval)
+
+
+def waitForTemp(predicate, timeout=None):
+    """
+    Block until the temperature satisfies a condition.
+
+    The temperature is read by a shared sampler thread, so any number of tasks can wait on
+    the temperature without each one polling the sensor, and a waiting task is only woken
+    up once its condition is met.
+
+    :param predicate:
+        Function taking the temperature in Celsius and returning True once the wait is over.
+    :param timeout:
+        Maximum number of seconds to wait or None to wait indefinitely.
+    :return:
+        True if the condition was met, False if the timeout expired first.
+    """
+    global _tempSampler, _tempError
+    with _tempCondition:
+        _tempWaiters.append(predicate)
+        try:
+            if _tempSampler is None:
+                _tempError = None
+                _tempSampler = threading.Thread(target=_sampleTemp, name='temp-sampler', daemon=True)
+                _tempSampler.start()
+            met = _tempCondition.wait_for(
+                lambda: _tempError is not None or (currentTemp is not None and predicate(currentTemp)),
+                timeout)
+            if _tempError is not None:
+                raise _tempError
+            return met
+        finally:
+            _tempWaiters.remove(predicate)
+
+
 def pumpDispense(pumpId, volume):
     """
     Dispense a number of ml from a particular pump.
@@ -10,29 +10,128 @@ The directory the recipes reside is configured in config.recipesPackage. All jso
 directory should be considered recipes.
 """
 
+import config
+import hashlib
 import json
+import os
+import pickle
 from os import listdir
 from os.path import isfile, join
 from recipes import state
-from recipes.base import Recipe
+from recipes.base import Recipe, linkSteps, normalizePlan
 
+# Bump when the compiled plan format changes so old entries in config.planCacheDir are ignored.
+PLAN_CACHE_VERSION = 2
 
-def getRecipeList():
+# Compiled plans already loaded by this process, keyed the same way as the files in
+# config.planCacheDir.
+_plans = {}
+
+# (Recipe.getStatus() object, message built from it by status(), JSON encoding of the message or
+# None if it wasn't requested yet). Replaced as a whole so concurrent requests always see a
+# consistent entry.
+_statusCache = (None, None, None)
+
+
+def _loadPlan(path):
     """
+    Load a recipe file and compile its plan.
+
+    The result is cached in memory, and the normalized steps are cached as a pickle in
+    config.planCacheDir, keyed by the SHA-256 of the file contents. A recipe file is only
+    parsed and normalized again when it changes, including across restarts.
+    :param path:
+    Path of the json recipe file.
     :return:
-    A list of modules in the config.recipesPackages.
-    It is assumed that these are all recipes.
+    (plan, firstStep)
+        The plan object and its first step as returned by base.compilePlan(), or None as
+        the first step if the plan is not valid.
+    :raises json.JSONDecodeError:
+    If the file is not valid JSON.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    key = '{0}-{1}'.format(hashlib.sha256(data).hexdigest(), PLAN_CACHE_VERSION)
+    if key in _plans:
+        return _plans[key]
+
+    # The cache file holds (plan, steps) with the unlinked steps from normalizePlan(), or
+    # None as the steps if the plan is not valid.
+    cachePath = join(config.planCacheDir, key + '.pkl')
+    cached = None
+    try:
+        with open(cachePath, 'rb') as f:
+            cached = pickle.load(f)
+    except Exception:
+        # Not cached yet or the cache file is unreadable, normalize it again below.
+        pass
+
+    if cached is None:
+        plan = json.loads(data)
+        try:
+            steps = normalizePlan(plan)
+        except Exception:
+            # Uploaded recipes only have to be valid JSON, so anything can end up here. An
+            # invalid plan must not break listing the other recipes, start() reports why it
+            # is invalid.
+            steps = None
+        cached = (plan, steps)
+        tmpPath = '{0}.{1}.tmp'.format(cachePath, os.getpid())
+        try:
+            os.makedirs(config.planCacheDir, exist_ok=True)
+            with open(tmpPath, 'wb') as f:
+                pickle.dump(cached, f)
+            os.replace(tmpPath, cachePath)
+        except (OSError, pickle.PicklingError):
+            # The cache is only an optimization.
+            try:
+                os.remove(tmpPath)
+            except OSError:
+                pass
+
+    plan, steps = cached
+    firstStep = None
+    if steps is not None:
+        try:
+            firstStep = linkSteps(steps)
+        except ValueError:
+            pass
+
+    _plans[key] = (plan, firstStep)
+    return _plans[key]
+
+
+def _getPlans():
+    """
+    :return:
+    A list of (plan, firstStep) for all json recipe files in config.recipesPackage. See
+    _loadPlan().
     """
     path = './{0}'.format(state.package.replace('.', '/'))
     files = [f for f in listdir(path) if isfile(join(path, f))]
-    recipeList = []
+    plans = []
 
     for f in files:
         if f.endswith('.json'):
             try:
-                recipeList.append(json.load(open(join(path, f))))
+                plans.append(_loadPlan(join(path, f)))
             except json.JSONDecodeError:
                 print("Error loading recipe file: {0}. File is not in proper JSON format".format(f))
+
+    return plans
+
+
+def getRecipeList():
+    """
+    :return:
+    A list of modules in the config.recipesPackages.
+    It is assumed that these are all recipes.
+    """
+    path = './{0}'.format(state.package.replace('.', '/'))
+    files = [f for f in listdir(path) if isfile(join(path, f))]
+    recipeList = [plan for plan, firstStep in _getPlans()]
+
+    for f in files:
         # This doesn't actually work yet because .4tv are not importable as modules
         if f.endswith('.4tv'):
             recipeList.append(f[:-4])
@@ -73,21 +172,28 @@ def start(name):
             return False, 'Recipe {0} is running. Stop it first.'.format(state.currentRecipe.plan['title'])
 
     # Check that it's a valid recipe.
-    recipe = getRecipeByName(name)
-    if recipe is None:
+    plan, firstStep = next(filter(lambda entry: isinstance(entry[0], dict) and entry[0].get('title') == name,
+                                  _getPlans()), (None, None))
+    if plan is None:
         return False, 'Recipe unknown.'
 
     # Start running the recipe
-    state.currentRecipe = Recipe(recipe)
+    try:
+        state.currentRecipe = Recipe(plan, firstStep)
+    except Exception as e:
+        return False, 'Recipe invalid: {0}'.format(e)
 
     state.currentRecipe.start()
 
     return True, ''
 
 
-def status():
+def status(force=False):
     """
     Get the status of the machine.
+    :param force:
+    Check whether the tasks of the current step are done even if they were checked less than
+    config.taskPollInterval seconds ago. See Recipe.updateStatus().
     :return:
     object
         message
@@ -115,7 +221,20 @@ def status():
         stepCompletionTime
             An ISO date string for when the current step is expected to be completed,
             or null if unknown. 
+
+        The same object is returned until the status changes, so it must not be modified.
     """
+    global _statusCache
+    recipeMessage = None
+    if state.currentRecipe is not None:
+        recipeMessage = state.currentRecipe.updateStatus(force)
+
+    # Recipe.getStatus() returns the same object until something changes, so the message
+    # built from it can be reused as well.
+    source, cachedMessage, _ = _statusCache
+    if source is recipeMessage and cachedMessage is not None:
+        return cachedMessage
+
     message = {
         'status': 'idle',
         'recipe': None,
@@ -125,21 +244,39 @@ def status():
         'stepCompletionTime': None
     }
 
-    if state.currentRecipe == None:
-        return message
-
-    recipeMessage = state.currentRecipe.updateStatus()
-    message['status'] = recipeMessage['status']
-    message['step'] = recipeMessage['step']
-    message['recipe'] = state.currentRecipe.plan['title']
-    message['message'] = recipeMessage['message']
-    message['options'] = recipeMessage['options']
-    message['icon'] = recipeMessage['icon']
-    message['stepCompletionTime'] = recipeMessage['stepCompletionTime']
+    if recipeMessage is not None:
+        message['status'] = recipeMessage['status']
+        message['step'] = recipeMessage['step']
+        message['recipe'] = state.currentRecipe.plan['title']
+        message['message'] = recipeMessage['message']
+        message['options'] = recipeMessage['options']
+        message['icon'] = recipeMessage['icon']
+        message['stepCompletionTime'] = recipeMessage['stepCompletionTime']
 
+    _statusCache = (recipeMessage, message, None)
     return message
 
 
+def statusJson(force=False):
+    """
+    Same as status() but already encoded as JSON. The encoded status is reused for as long
+    as the status doesn't change.
+    :param force:
+    See status().
+    :return:
+    bytes
+        The status() object encoded as JSON.
+    """
+    global _statusCache
+    message = status(force)
+    source, cachedMessage, encoded = _statusCache
+    if cachedMessage is not message or encoded is None:
+        encoded = json.dumps(message).encode('utf-8')
+        if cachedMessage is message:
+            _statusCache = (source, message, encoded)
+    return encoded
+
+
 def stop():
     """
     Stop the currently running recipe.
@@ -82,9 +82,12 @@ plan object
                     successfully completed.
 """
 
-from recipes import celery
+from recipes import celery, tasks
+import config
 import hardware
+import sys
 import threading
+import time
 from datetime import datetime, timedelta, timezone
 
 
@@ -96,26 +99,259 @@ NEXT_STEP = 'next'
 STEP_USER_OPTIONS = 'options'
 LAST_STEP = 'done'
 
+# Tasks that are shorthands for the maintain task with a fixed type. They are converted to
+# maintain when the plan is loaded.
+MAINTAIN_SHORTHANDS = {
+    'maintainHeat': 'heat',
+    'maintainCool': 'cool',
+}
+
+def normalizePlan(plan):
+    """
+    Converts the steps of a plan to NormalizedSteps. The steps still refer to each other by
+    nr, see linkSteps(), so unlike the linked steps they can be pickled regardless of the
+    length of the plan.
+    :param plan:
+    The recipe plan. See module documentation for object description.
+    :return:
+    The list of NormalizedSteps in the order of the plan.
+    :raises ValueError:
+    If one of the steps is not valid.
+    """
+    if not isinstance(plan, dict):
+        raise ValueError('Plan is not an object')
+    planSteps = plan.get(RECIPE_STEPS)
+    if planSteps is None:
+        raise ValueError('Plan has no steps')
+    if not isinstance(planSteps, list):
+        raise ValueError('Plan steps is not a list')
+    # Steps without an nr fall back to their position in the list.
+    steps = [NormalizedStep(step, index) for index, step in enumerate(planSteps)]
+    if len(steps) == 0:
+        raise ValueError('Plan has no steps')
+    return steps
+
+
+def _isStepNr(value):
+    """
+    Check if a value can be used as a step nr. Step nrs are used as dictionary keys when the
+    steps are linked, so they have to be hashable.
+    :param value:
+    The value to check.
+    :return:
+    True if the value can be used as a step nr.
+    """
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+def linkSteps(steps):
+    """
+    Links the steps returned by normalizePlan() together, so that next and optionNext point
+    directly at the step to run instead of at its nr. Running the recipe then only has to
+    follow these links. The steps are modified in place.
+    :param steps:
+    The list returned by normalizePlan().
+    :return:
+    The first NormalizedStep of the plan.
+    :raises ValueError:
+    If the steps don't form a valid plan.
+    """
+    stepsByNr = {}
+    for step in steps:
+        if step.nr in stepsByNr:
+            raise ValueError('Duplicate step nr {0}'.format(step.nr))
+        stepsByNr[step.nr] = step
+
+    def link(step, target):
+        if target not in stepsByNr:
+            raise ValueError('Step {0} points to unknown step {1}'.format(step.nr, target))
+        return stepsByNr[target]
+
+    for step in steps:
+        if step.next is not None:
+            step.next = link(step, step.next)
+        for text, target in step.optionNext.items():
+            step.optionNext[text] = link(step, target)
+
+    return steps[0]
+
+
+def compilePlan(plan):
+    """
+    Normalizes and links the steps of a plan. See normalizePlan() and linkSteps().
+    :param plan:
+    The recipe plan. See module documentation for object description.
+    :return:
+    The first NormalizedStep of the plan.
+    :raises ValueError:
+    If the plan is not valid.
+    """
+    return linkSteps(normalizePlan(plan))
+
+
+class NormalizedStep:
+    """
+    A single plan step with all its optional fields filled in. Steps are converted once when
+    the recipe is loaded so running them doesn't need to re-inspect the plan, and so an
+    invalid plan is rejected before it is started rather than halfway through.
+    """
+    __slots__ = ('nr', 'message', 'next', 'icon', 'options', 'optionNext', 'tasks', 'time', 'done')
+
+    def __init__(self, step, index):
+        """
+        Constructor. Validates the step and fills in the defaults.
+        :param step:
+        The step object from the plan. See module documentation for object description.
+        :param index:
+        Position of the step in the plan. Used as nr if the step doesn't have one.
+        :raises ValueError:
+        If the step is not valid.
+        """
+        if not isinstance(step, dict):
+            raise ValueError('Step {0} is not an object'.format(index))
+        self.nr = step.get('nr', index)
+        if not _isStepNr(self.nr):
+            raise ValueError('Step {0} has an invalid nr {1!r}'.format(index, self.nr))
+        self.message = step.get('message')
+        if self.message is None:
+            raise ValueError('Step {0} has no message'.format(self.nr))
+        # next and optionNext hold step nrs until linkSteps() links them to the steps.
+        self.next = step.get(NEXT_STEP)
+        if not _isStepNr(self.next):
+            raise ValueError('Step {0} has an invalid next {1!r}'.format(self.nr, self.next))
+        # Icons and task names come from a small fixed set and repeat across steps, so share
+        # a single string object for each.
+        self.icon = step.get('icon')
+        if self.icon is not None:
+            if not isinstance(self.icon, str):
+                raise ValueError('Step {0} has an invalid icon {1!r}'.format(self.nr, self.icon))
+            self.icon = sys.intern(self.icon)
+
+        self.options = []
+        self.optionNext = {}
+        options = step.get(STEP_USER_OPTIONS, [])
+        if not isinstance(options, list):
+            raise ValueError('Step {0} options is not a list'.format(self.nr))
+        for option in options:
+            if not isinstance(option, dict):
+                raise ValueError('Step {0} has an option that is not an object'.format(self.nr))
+            text = option.get('text')
+            target = option.get(NEXT_STEP)
+            if text is None or target is None:
+                raise ValueError('Step {0} has an option without text or next'.format(self.nr))
+            if not isinstance(text, str) or not _isStepNr(target):
+                raise ValueError('Step {0} has an invalid option {1!r}'.format(self.nr, option))
+            # Options are looked up by their text, so it has to be unique within the step.
+            if text in self.optionNext:
+                raise ValueError('Step {0} has more than one option {1}'.format(self.nr, text))
+            self.options.append(text)
+            self.optionNext[text] = target
+
+        # List of (baseTask, parameters) to run, or None if the step doesn't run any tasks.
+        self.tasks = None
+        self.time = None
+        taskDefinitions = step.get(STEP_TASKS)
+        if taskDefinitions is None and step.get(TASK_TYPE, 'humanTask') != 'humanTask':
+            taskDefinitions = [step]
+        if taskDefinitions is not None:
+            if not isinstance(taskDefinitions, list):
+                raise ValueError('Step {0} tasks is not a list'.format(self.nr))
+            self.tasks = []
+            durations = []
+            for task in taskDefinitions:
+                if not isinstance(task, dict):
+                    raise ValueError('Step {0} has a task that is not an object'.format(self.nr))
+                parameters = task.get(TASK_PARAMETERS, {})
+                if not isinstance(parameters, dict):
+                    raise ValueError('Step {0} has task parameters that are not an object'.format(self.nr))
+                duration = parameters.get('time')
+                if duration is not None:
+                    if isinstance(duration, bool) or not isinstance(duration, (int, float)):
+                        raise ValueError('Step {0} has an invalid task time {1!r}'.format(self.nr, duration))
+                    durations.append(duration)
+
+                taskType = task.get(TASK_TYPE, 'humanTask')
+                if not isinstance(taskType, str):
+                    raise ValueError('Step {0} has an invalid task {1!r}'.format(self.nr, taskType))
+                if taskType == 'humanTask':
+                    continue
+                if taskType not in tasks.tasks:
+                    raise ValueError('Step {0} uses unknown task {1}'.format(self.nr, taskType))
+                shorthandType = MAINTAIN_SHORTHANDS.get(taskType)
+                if shorthandType is not None:
+                    parameters = dict(parameters, type=shorthandType)
+                    taskType = 'maintain'
+                self.tasks.append((sys.intern(taskType), parameters))
+
+            # Longest task duration in seconds or None if none of the tasks specify one.
+            if len(durations) > 0:
+                self.time = max(durations)
+
+        self.done = step.get(LAST_STEP, False) == True
+
+
+def _statusField(name):
+    """
+    Creates a property for one of the fields reported by Recipe.getStatus(). The value is
+    stored in the slot of the same name prefixed with an underscore and setting it drops the
+    cached status.
+    :param name:
+    Name of the field.
+    :return:
+    The property.
+    """
+    slot = '_' + name
+
+    def getField(self):
+        return getattr(self, slot)
+
+    def setField(self, value):
+        setattr(self, slot, value)
+        self._statusCache = None
+
+    return property(getField, setField)
+
+
 class Recipe:
-    step = 0
-    message = ''
-    status = 'idle'
-    options = []
-    icon = ''
-    stepCompletionTime = None
-    currentRecipe = None
-    currentTasks = []
-    mutex = threading.Lock()
-
-    def __init__(self, plan):
+    __slots__ = ('_step', '_message', '_status', '_options', '_icon', '_stepCompletionTime', '_statusCache',
+                 'currentRecipe', 'currentTasks', 'mutex', 'plan', '_firstStep', '_currentStep', '_nextTaskCheck')
+
+    step = _statusField('step')
+    message = _statusField('message')
+    status = _statusField('status')
+    options = _statusField('options')
+    icon = _statusField('icon')
+    stepCompletionTime = _statusField('stepCompletionTime')
+
+    def __init__(self, plan, firstStep=None):
         """
-        Constructor. Saves the plan.
+        Constructor. Saves the plan and validates its steps.
         :param plan:
         The recipe plan. See module documentation for object description.
+        :param firstStep:
+        The result of compilePlan(plan) if the plan was already compiled, otherwise None.
+        :raises ValueError:
+        If the plan is not valid.
         """
+        self.step = 0
+        self.message = ''
+        self.status = 'idle'
+        self.options = []
+        self.icon = ''
+        self.stepCompletionTime = None
+        self.currentTasks = []
+        self._nextTaskCheck = 0.0
+        # Reentrant because updateStatus() calls stop() while holding it.
+        self.mutex = threading.RLock()
         self.plan = plan
-        if hasattr(plan, 'title'):
-            self.currentRecipe = plan.title
+        self.currentRecipe = plan.get('title')
+
+        self._firstStep = firstStep if firstStep is not None else compilePlan(plan)
+        self._currentStep = None
 
     def start(self):
         """
@@ -123,8 +359,9 @@ class Recipe:
         :return:
         None
         """
-        self.step = 0
-        self.runStep()
+        with self.mutex:
+            self._currentStep = self._firstStep
+            self.runStep()
 
     def stop(self):
         """
@@ -133,14 +370,21 @@ class Recipe:
         :return:
         None
         """
-        self.step = -1
-        self.status = 'idle'
-        self.message = ''
-        self.options = []
-        self.stepCompletionTime = None
-        hardware.turnHeaterOff()
-        hardware.turnCoolerOff()
-        self.stopTasks()
+        with self.mutex:
+            # Nothing was started since the recipe was created or last stopped, so there is no
+            # hardware to turn off.
+            if self.status == 'idle' and len(self.currentTasks) == 0:
+                return
+
+            self.step = -1
+            self._currentStep = None
+            self.status = 'idle'
+            self.message = ''
+            self.options = []
+            self.stepCompletionTime = None
+            hardware.turnHeaterOff()
+            hardware.turnCoolerOff()
+            self.stopTasks()
 
     def getStatus(self):
         """
@@ -169,39 +413,51 @@ class Recipe:
             stepCompletionTime
                 An ISO date string for when the current step is expected to be completed, or None
                 if unknown. 
+
+            The same object is returned until the status changes, so it must not be modified.
         """
-        ret = {
-            'status': self.status,
-            'step': self.step,
-            'message': self.message,
-            'options': self.options,
-            'icon': self.icon,
-            'stepCompletionTime': self.stepCompletionTime,
-        }
-        return ret
-
-    def updateStatus(self):
+        # Built under the mutex, otherwise a status change between reading the fields and
+        # storing the dict would leave the old status cached.
+        with self.mutex:
+            if self._statusCache is None:
+                self._statusCache = {
+                    'status': self._status,
+                    'step': self._step,
+                    'message': self._message,
+                    'options': self._options,
+                    'icon': self._icon,
+                    'stepCompletionTime': self._stepCompletionTime,
+                }
+            return self._statusCache
+
+    def updateStatus(self, force=False):
         """
         Updates the current status and then returns it. This effectively polls the celery task
         to see if it has completed.
+        :param force:
+        Check the tasks even if the last check was less than config.taskPollInterval seconds ago.
+        Used when a task reports that it has completed.
         :return:
         object
             Same as getStatus()
         """
-        self.mutex.acquire()
-        if self.status == 'running':
-            if self.areTasksComplete():
-                currentStep = self.plan[RECIPE_STEPS][self.step]
-                if any(task.failed() for task in self.currentTasks): 
-                    self.status = 'error'
-                    self.message = 'Task execution failed.'
-                elif(LAST_STEP in currentStep) and (currentStep[LAST_STEP] == True):
-                    self.stop()
-                else:
-                    if NEXT_STEP in currentStep:
-                        self.step = currentStep[NEXT_STEP]
-                        self.runStep()
-        self.mutex.release()
+        with self.mutex:
+            # Checking the tasks asks the celery backend, and a step can't finish within a few
+            # hundred milliseconds anyway, so only check every config.taskPollInterval seconds.
+            now = time.monotonic()
+            if self.status == 'running' and (force or now >= self._nextTaskCheck):
+                self._nextTaskCheck = now + config.taskPollInterval
+                if self.areTasksComplete():
+                    currentStep = self._currentStep
+                    if any(task.failed() for task in self.currentTasks): 
+                        self.status = 'error'
+                        self.message = 'Task execution failed.'
+                    elif currentStep.done:
+                        self.stop()
+                    else:
+                        if currentStep.next is not None:
+                            self._currentStep = currentStep.next
+                            self.runStep()
         return self.getStatus()
 
     def selectOption(self, optionValue):
@@ -219,24 +475,21 @@ class Recipe:
             string
                 The message to display to the user in case of failure.
         """
-        found = False
-        if STEP_USER_OPTIONS in self.plan[RECIPE_STEPS][self.step]:
-            for option in self.plan[RECIPE_STEPS][self.step][STEP_USER_OPTIONS]:
-                if option['text'] == optionValue:
-                    self.step = option[NEXT_STEP]
-                    found = True
+        with self.mutex:
+            step = self._currentStep
+            nxt = step.optionNext.get(optionValue) if step is not None else None
+            if nxt is None:
+                return False, 'Invalid option {0}'.format(optionValue)
 
-        if not found:
-            return False, 'Invalid option {0}'.format(optionValue)
-
-        ret = self.runStep()
-        return ret, self.message
+            self._currentStep = nxt
+            ret = self.runStep()
+            return ret, self.message
 
     def runStep(self):
         """
         Run the current step of the recipe. The actual step advancement management is left
         to the other methods. If you call this method twice for the same step, that step
-        will be executed twice.
+        will be executed twice. Must be called with the mutex held.
 
         :return:
         list
@@ -245,42 +498,31 @@ class Recipe:
             string
                 The message to display to the user in case of failure.
         """
-        print('Running step {0}'.format(self.step))
-        step = self.plan[RECIPE_STEPS][self.step]
-        self.message = step['message']
+        step = self._currentStep
+        self.step = step.nr
+        celery.logger.debug('Running step %s', self.step)
+        self.message = step.message
         self.stepCompletionTime = None
         self.currentTasks = []
-        options = []
-
-        if STEP_USER_OPTIONS in step:
-            for option in step[STEP_USER_OPTIONS]:
-                options.append(option['text'])
-            if len(options) > 0:
-                self.status = 'user_input'
-
-        self.options = options
-
-        if('icon' in step):
-            self.icon = step['icon']
-
-        if STEP_TASKS not in step and TASK_TYPE in step and step[TASK_TYPE] != 'humanTask':
-            step[STEP_TASKS] = [{TASK_TYPE: step[TASK_TYPE], TASK_PARAMETERS: step[TASK_PARAMETERS]}]
-
-        if STEP_TASKS in step:
-            for task in step[STEP_TASKS]:
-                if TASK_TYPE in task and task[TASK_TYPE] != 'humanTask':
-                    self.currentTasks.append(celery.runTask(task[TASK_TYPE], task[TASK_PARAMETERS]))
-            
-            tasksWithDurations = filter(
-                lambda task: (TASK_PARAMETERS in task) and ('time' in task[TASK_PARAMETERS]), step[STEP_TASKS])
-            taskDurations = list(map(lambda task: task[TASK_PARAMETERS]['time'], tasksWithDurations))
-            if len(taskDurations) > 0:
-                duration = timedelta(seconds=max(taskDurations))
+
+        self.options = step.options
+        if len(self.options) > 0:
+            self.status = 'user_input'
+
+        if step.icon is not None:
+            self.icon = step.icon
+
+        if step.tasks is not None:
+            for taskType, parameters in step.tasks:
+                self.currentTasks.append(celery.runTask(taskType, parameters))
+
+            if step.time is not None:
+                duration = timedelta(seconds=step.time)
                 self.stepCompletionTime = (datetime.now(tz=timezone.utc) + duration).isoformat()
-                
+
             self.status = 'running'
 
-        if step.get(LAST_STEP, False) == True:
+        if step.done:
             self.status = 'complete'
 
         return True
@@ -64,7 +64,7 @@ def updateStatus(*args):
     :return:
         None
     """
-    requests.get(url=config.localUrl + '/status')
+    requests.get(url=config.localUrl + '/status', params={'force': 'true'})
 
 def runTask(task, parameters):
     """
@@ -1,7 +1,54 @@
+import logging
 from recipes import celery
 import hardware
 
 
+# Bounds in seconds for how often maintain() samples the temperature. The minimum is only used
+# inside the tolerance band, outside of it the heater/cooler is already switched on and polling
+# faster than MAINTAIN_DEFAULT_INTERVAL doesn't help.
+MAINTAIN_MIN_INTERVAL = 0.1
+MAINTAIN_DEFAULT_INTERVAL = 0.5
+MAINTAIN_MAX_INTERVAL = 5.0
+
+
+def _maintainInterval(temp, rate, low, high):
+    """
+    Estimate how long maintain() can sleep before the temperature needs to be looked at again.
+
+    Inside the tolerance band this is about the time until the temperature reaches the edge
+    it is moving towards, so sampling only speeds up close to an edge. Outside of the band
+    it is about the time until the temperature gets back into the band, but never shorter
+    than MAINTAIN_DEFAULT_INTERVAL.
+
+    :param temp:
+        The current temperature.
+    :param rate:
+        The rate of change of the temperature in degrees per second.
+    :param low:
+        The lower edge of the tolerance band.
+    :param high:
+        The upper edge of the tolerance band.
+    :return:
+        The number of seconds to sleep.
+    """
+    if low <= temp <= high:
+        if rate > 0:
+            eta = (high - temp) / rate
+        elif rate < 0:
+            eta = (temp - low) / -rate
+        else:
+            eta = MAINTAIN_MAX_INTERVAL
+        return max(MAINTAIN_MIN_INTERVAL, min(MAINTAIN_MAX_INTERVAL, eta))
+
+    if temp < low and rate > 0:
+        eta = (low - temp) / rate
+    elif temp > high and rate < 0:
+        eta = (temp - high) / -rate
+    else:
+        eta = MAINTAIN_DEFAULT_INTERVAL
+    return max(MAINTAIN_DEFAULT_INTERVAL, min(MAINTAIN_MAX_INTERVAL, eta))
+
+
 def heat(parameters):
     """
     Turn on the heater and reach a target temperature.
@@ -13,10 +60,9 @@ def heat(parameters):
         None
     """
     targetTemp = parameters['temp']
-    celery.logger.info('heating water to {0}...'.format(targetTemp))
+    celery.logger.info('heating water to %s...', targetTemp)
     hardware.turnHeaterOn()
-    while hardware.getTemp() < targetTemp:
-        hardware.sleep(0.5)
+    hardware.waitForTemp(lambda temp: temp >= targetTemp)
     hardware.turnHeaterOff()
 
 
@@ -31,10 +77,9 @@ def cool(parameters):
         None
     """
     targetTemp = parameters['temp']
-    celery.logger.info('cooling water to {0}...'.format(targetTemp))
+    celery.logger.info('cooling water to %s...', targetTemp)
     hardware.turnCoolerOn()
-    while hardware.getTemp() > targetTemp:
-        hardware.sleep(0.5)
+    hardware.waitForTemp(lambda temp: temp <= targetTemp)
     hardware.turnCoolerOff()
 
 
@@ -51,8 +96,7 @@ def maintainCool(parameters):
     :return:
         None
     """
-    parameters['type'] = 'cool'
-    maintain(parameters)
+    maintain(dict(parameters, type='cool'))
 
 
 def maintainHeat(parameters):
@@ -68,8 +112,7 @@ def maintainHeat(parameters):
     :return:
         None
     """
-    parameters['type'] = 'heat'
-    maintain(parameters)
+    maintain(dict(parameters, type='heat'))
 
 
 def maintain(parameters):
@@ -95,23 +138,54 @@ def maintain(parameters):
     tolerance = parameters['tolerance']
     type = parameters['type']
 
-    interval = 0.5
-    start = hardware.secondSinceStart()
-
-    while (hardware.secondSinceStart() - start) < duration:
-        hardware.sleep(interval)
-        currentTemp = hardware.getTemp()
-        celery.logger.info('temperature @ {0}'.format(currentTemp))
-        if currentTemp - tolerance > targetTemp:
-            if type == 'heat':
-                hardware.turnHeaterOff()
-            else:
-                hardware.turnCoolerOn()
-        if currentTemp + tolerance < targetTemp:
-            if type == 'heat':
-                hardware.turnHeaterOn()
-            else:
-                hardware.turnCoolerOff()
+    interval = MAINTAIN_DEFAULT_INTERVAL
+    deadline = hardware.secondSinceStart() + duration
+    prevTemp = None
+    prevTime = None
+
+    # Bind everything the loop touches to locals, this loop can run for hours.
+    _sleep = hardware.ioSleep
+    _getTemp = hardware.getTemp
+    _now = hardware.secondSinceStart
+    _log = celery.logger.info
+    _logTemp = celery.logger.isEnabledFor(logging.INFO)
+    _queue = hardware.queueCommand
+    _flush = hardware.flushCommands
+    _over, _under = {
+        'heat': (hardware.turnHeaterOff, hardware.turnHeaterOn),
+        'cool': (hardware.turnCoolerOn, hardware.turnCoolerOff),
+    }[type]
+
+    # Last action sent to the hardware, so it is only switched when the state changes.
+    lastAction = None
+
+    hardware.holdLowLatency()
+    try:
+        while _now() < deadline:
+            _sleep(interval)
+            currentTemp = _getTemp()
+            now = _now()
+            if _logTemp:
+                _log('temperature @ %s', currentTemp)
+            if currentTemp - tolerance > targetTemp:
+                if lastAction is not _over:
+                    _queue(_over)
+                    lastAction = _over
+            elif currentTemp + tolerance < targetTemp:
+                if lastAction is not _under:
+                    _queue(_under)
+                    lastAction = _under
+            _flush()
+
+            if prevTime is not None and now > prevTime:
+                rate = (currentTemp - prevTemp) / (now - prevTime)
+                interval = _maintainInterval(currentTemp, rate, targetTemp - tolerance, targetTemp + tolerance)
+            prevTemp = currentTemp
+            prevTime = now
+            # Don't sleep past the end of the maintain window.
+            interval = min(interval, deadline - now)
+    finally:
+        hardware.releaseLowLatency()
 
     hardware.turnHeaterOff()
     hardware.turnCoolerOff()
@@ -145,11 +219,15 @@ def stir(parameters):
     """
     duration = parameters['time']
 
-    interval = 0.5
-    start = hardware.secondSinceStart()
+    interval = MAINTAIN_DEFAULT_INTERVAL
+    deadline = hardware.secondSinceStart() + duration
     hardware.turnStirrerOn()
-    while (hardware.secondSinceStart() - start) < duration:
-        hardware.sleep(interval)
+    hardware.holdLowLatency()
+    try:
+        while hardware.secondSinceStart() < deadline:
+            hardware.ioSleep(interval)
+    finally:
+        hardware.releaseLowLatency()
     hardware.turnStirrerOff()
 
 
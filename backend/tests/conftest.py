@@ -0,0 +1,27 @@
+# Importing the hardware package sets up the devices from the hardware configuration, which
+# only works on the actual hardware. Replace the device list with the simulated devices
+# before anything imports hardware so the tests can run anywhere.
+
+import os
+import sys
+import types
+
+# w1thermsensor tries to load the 1-wire kernel modules when it is imported.
+os.environ.setdefault('W1THERMSENSOR_NO_KERNEL_MODULE', '1')
+
+
+def setupSimulatedDevices():
+    from hardware.temperaturecontroller.simulation import SimulatedTempController
+    from hardware.stirring.simulation import SimulatedStirrer
+    from hardware.reagentdispenser.simulation import SimulatedReagentDispenser
+
+    return {
+        'reactor-temperature-controller': SimulatedTempController({}),
+        'reactor-stirrer': SimulatedStirrer(),
+        'reactor-reagent-dispenser': SimulatedReagentDispenser(),
+    }
+
+
+devicelist = types.ModuleType('hardware.devicelist')
+devicelist.setupDevices = setupSimulatedDevices
+sys.modules['hardware.devicelist'] = devicelist
@@ -13,6 +13,7 @@ from tests import celeryMock
 def client():
     config.hardwarePackage = 'simulation'
     config.hardwareSpeedup = 10
+    config.taskPollInterval = 0
 
     config.celeryMode = 'test'
     config.recipesPackage = 'tests.recipe'
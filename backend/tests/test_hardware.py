@@ -0,0 +1,94 @@
+import threading
+import pytest
+import config
+import hardware
+
+
+class StubTempController:
+    """
+    Temperature controller returning a fixed sequence of readings, repeating the last one.
+    Remembers the threads reading from it.
+    """
+
+    def __init__(self, temps=None, error=None):
+        self.temps = list(temps or [20])
+        self.error = error
+        self.threads = set()
+
+    def getTemp(self):
+        self.threads.add(threading.current_thread())
+        if self.error is not None:
+            raise self.error
+        if len(self.temps) > 1:
+            return self.temps.pop(0)
+        return self.temps[0]
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    def install(*args, **kwargs):
+        controller = StubTempController(*args, **kwargs)
+        monkeypatch.setattr(hardware, 'tempController', controller)
+        return controller
+
+    monkeypatch.setattr(config, 'hardwareSpeedup', None)
+    monkeypatch.setattr(hardware, 'tempSampleInterval', 0.01)
+    yield install
+    sampler = hardware._tempSampler
+    if sampler is not None:
+        sampler.join(1)
+
+
+def test_wait_for_temp_met(stub):
+    stub([20, 40, 60, 80, 100])
+
+    assert hardware.waitForTemp(lambda temp: temp >= 80, timeout=5)
+
+
+def test_wait_for_temp_timeout(stub):
+    stub([20])
+
+    assert not hardware.waitForTemp(lambda temp: temp >= 80, timeout=0.2)
+
+
+def test_wait_for_temp_error(stub):
+    stub(error=OSError('sensor disconnected'))
+
+    with pytest.raises(OSError, match='sensor disconnected'):
+        hardware.waitForTemp(lambda temp: temp >= 80, timeout=5)
+    assert hardware._tempSampler is None
+
+
+def test_sampler_exits_after_last_waiter(stub):
+    controller = stub([20, 100])
+
+    assert hardware.waitForTemp(lambda temp: temp >= 100, timeout=5)
+
+    assert len(controller.threads) == 1
+    sampler = controller.threads.pop()
+    sampler.join(1)
+    assert not sampler.is_alive()
+    assert hardware._tempSampler is None
+    assert hardware.currentTemp is None
+
+
+def test_low_latency_failure_not_retried(monkeypatch):
+    opened = []
+
+    def open(path, flags):
+        opened.append(path)
+        raise PermissionError(path)
+
+    monkeypatch.setattr(config, 'hardwareSpeedup', None)
+    monkeypatch.setattr(config, 'cpuLatencyLimit', 0)
+    monkeypatch.setattr(hardware.os, 'open', open)
+
+    hardware.holdLowLatency()
+    for _ in range(3):
+        hardware.ioSleep(0)
+    hardware.releaseLowLatency()
+    assert opened == ['/dev/cpu_dma_latency']
+
+    # Retried once the previous window is over.
+    hardware.ioSleep(0)
+    assert len(opened) == 2
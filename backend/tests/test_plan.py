@@ -0,0 +1,164 @@
+import pytest
+from recipes import base
+
+
+def plan(*steps):
+    return {'title': 'test', 'steps': list(steps)}
+
+
+def test_compile_valid_plan():
+    first = base.compilePlan(plan(
+        {
+            'nr': 0,
+            'message': 'Place egg in chamber',
+            'icon': 'reaction_chamber',
+            'options': [{'text': 'Done', 'next': 1}, {'text': 'Skip', 'next': 2}],
+        },
+        {
+            'nr': 1,
+            'message': 'Heating water...',
+            'next': 2,
+            'tasks': [
+                {'baseTask': 'heat', 'parameters': {'temp': 100}},
+                {'baseTask': 'stir', 'parameters': {'time': 60}},
+                {'baseTask': 'humanTask', 'parameters': {'time': 90}},
+            ],
+        },
+        {
+            'nr': 2,
+            'message': 'Done',
+            'done': True,
+        },
+    ))
+
+    assert first.nr == 0
+    assert first.message == 'Place egg in chamber'
+    assert first.icon == 'reaction_chamber'
+    assert first.options == ['Done', 'Skip']
+    assert first.tasks is None
+    assert first.next is None
+    assert not first.done
+
+    heating = first.optionNext['Done']
+    last = first.optionNext['Skip']
+    assert heating.nr == 1
+    assert heating.icon is None
+    assert heating.options == []
+    assert heating.tasks == [('heat', {'temp': 100}), ('stir', {'time': 60})]
+    assert heating.time == 90
+    assert heating.next is last
+
+    assert last.nr == 2
+    assert last.done
+    assert last.next is None
+    assert last.tasks is None
+    assert last.time is None
+
+
+def test_compile_base_task():
+    first = base.compilePlan(plan(
+        {'nr': 0, 'message': 'Heating', 'baseTask': 'heat', 'parameters': {'temp': 100}, 'next': 1},
+        {'nr': 1, 'message': 'Waiting', 'baseTask': 'humanTask', 'next': 2},
+        {'nr': 2, 'message': 'Done', 'done': True},
+    ))
+
+    assert first.tasks == [('heat', {'temp': 100})]
+    assert first.next.tasks is None
+
+
+def test_compile_steps_without_nr():
+    first = base.compilePlan(plan(
+        {'message': 'First', 'next': 1},
+        {'message': 'Second', 'done': True},
+    ))
+
+    assert first.nr == 0
+    assert first.next.nr == 1
+
+
+@pytest.mark.parametrize('baseTask,type', [('maintainHeat', 'heat'), ('maintainCool', 'cool')])
+def test_compile_maintain_shorthand(baseTask, type):
+    parameters = {'time': 60, 'temp': 100, 'tolerance': 2}
+    first = base.compilePlan(plan(
+        {'nr': 0, 'message': 'Maintaining', 'tasks': [{'baseTask': baseTask, 'parameters': parameters}]},
+    ))
+
+    assert first.tasks == [('maintain', {'time': 60, 'temp': 100, 'tolerance': 2, 'type': type})]
+    assert first.time == 60
+    assert 'type' not in parameters
+
+
+def test_reject_no_steps():
+    with pytest.raises(ValueError, match='no steps'):
+        base.compilePlan(plan())
+
+
+def test_reject_missing_message():
+    with pytest.raises(ValueError, match='no message'):
+        base.compilePlan(plan({'nr': 0, 'done': True}))
+
+
+@pytest.mark.parametrize('option', [{'text': 'Done'}, {'next': 0}])
+def test_reject_bad_option(option):
+    with pytest.raises(ValueError, match='option without text or next'):
+        base.compilePlan(plan({'nr': 0, 'message': 'Choose', 'options': [option]}))
+
+
+def test_reject_duplicate_option():
+    with pytest.raises(ValueError, match='more than one option Done'):
+        base.compilePlan(plan(
+            {'nr': 0, 'message': 'Choose', 'options': [{'text': 'Done', 'next': 1}, {'text': 'Done', 'next': 1}]},
+            {'nr': 1, 'message': 'Done', 'done': True},
+        ))
+
+
+def test_reject_duplicate_nr():
+    with pytest.raises(ValueError, match='Duplicate step nr 0'):
+        base.compilePlan(plan(
+            {'nr': 0, 'message': 'First', 'next': 0},
+            {'nr': 0, 'message': 'Second', 'done': True},
+        ))
+
+
+def test_reject_unknown_next():
+    with pytest.raises(ValueError, match='points to unknown step 5'):
+        base.compilePlan(plan({'nr': 0, 'message': 'First', 'next': 5}))
+
+
+def test_reject_unknown_option_next():
+    with pytest.raises(ValueError, match='points to unknown step 5'):
+        base.compilePlan(plan({'nr': 0, 'message': 'Choose', 'options': [{'text': 'Done', 'next': 5}]}))
+
+
+def test_reject_unknown_task():
+    with pytest.raises(ValueError, match='unknown task boil'):
+        base.compilePlan(plan({'nr': 0, 'message': 'Boiling', 'baseTask': 'boil', 'parameters': {}}))
+
+
+@pytest.mark.parametrize('value,error', [
+    ([], 'Plan is not an object'),
+    ({'title': 'test'}, 'Plan has no steps'),
+    ({'title': 'test', 'steps': {'nr': 0}}, 'Plan steps is not a list'),
+])
+def test_reject_bad_plan(value, error):
+    with pytest.raises(ValueError, match=error):
+        base.compilePlan(value)
+
+
+@pytest.mark.parametrize('step,error', [
+    ('oops', 'Step 0 is not an object'),
+    ({'nr': [0], 'message': 'First'}, 'Step 0 has an invalid nr'),
+    ({'nr': 0, 'message': 'First', 'next': [1]}, 'Step 0 has an invalid next'),
+    ({'nr': 0, 'message': 'First', 'icon': 5}, 'Step 0 has an invalid icon'),
+    ({'nr': 0, 'message': 'Choose', 'options': {'text': 'Done'}}, 'Step 0 options is not a list'),
+    ({'nr': 0, 'message': 'Choose', 'options': ['Done']}, 'Step 0 has an option that is not an object'),
+    ({'nr': 0, 'message': 'Choose', 'options': [{'text': 'Done', 'next': [1]}]}, 'Step 0 has an invalid option'),
+    ({'nr': 0, 'message': 'Heating', 'tasks': {'baseTask': 'heat'}}, 'Step 0 tasks is not a list'),
+    ({'nr': 0, 'message': 'Heating', 'tasks': ['heat']}, 'Step 0 has a task that is not an object'),
+    ({'nr': 0, 'message': 'Heating', 'baseTask': 'heat', 'parameters': 100}, 'parameters that are not an object'),
+    ({'nr': 0, 'message': 'Stirring', 'baseTask': 'stir', 'parameters': {'time': '60'}}, 'invalid task time'),
+    ({'nr': 0, 'message': 'Heating', 'tasks': [{'baseTask': ['heat']}]}, 'Step 0 has an invalid task'),
+])
+def test_reject_bad_step(step, error):
+    with pytest.raises(ValueError, match=error):
+        base.compilePlan(plan(step))
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import pickle
+import pytest
+import config
+import recipes
+from recipes import state
+
+
+PLAN = {
+    'title': 'test',
+    'steps': [
+        {'nr': 0, 'message': 'First', 'next': 1},
+        {'nr': 1, 'message': 'Done', 'done': True},
+    ],
+}
+
+
+@pytest.fixture
+def recipeDir(tmp_path, monkeypatch):
+    """
+    Empty recipe directory with the plan cache in a separate directory.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, 'planCacheDir', str(tmp_path / 'cache'))
+    monkeypatch.setattr(state, 'package', 'files')
+    monkeypatch.setattr(state, 'currentRecipe', None)
+    monkeypatch.setattr(recipes, '_plans', {})
+    path = tmp_path / 'files'
+    path.mkdir()
+    return path
+
+
+def writeRecipe(directory, name, plan):
+    path = directory / name
+    path.write_text(json.dumps(plan))
+    key = '{0}-{1}'.format(hashlib.sha256(path.read_bytes()).hexdigest(), recipes.PLAN_CACHE_VERSION)
+    return str(path), directory.parent / 'cache' / (key + '.pkl')
+
+
+def test_cache_miss_writes_pickle(recipeDir):
+    path, cachePath = writeRecipe(recipeDir, 'test.json', PLAN)
+
+    plan, firstStep = recipes._loadPlan(path)
+
+    assert plan == PLAN
+    assert firstStep.next.done
+    assert cachePath.is_file()
+    cachedPlan, steps = pickle.loads(cachePath.read_bytes())
+    assert cachedPlan == PLAN
+    assert [step.nr for step in steps] == [0, 1]
+
+
+def test_cache_hit_skips_normalize(recipeDir, monkeypatch):
+    path, cachePath = writeRecipe(recipeDir, 'test.json', PLAN)
+    recipes._loadPlan(path)
+    monkeypatch.setattr(recipes, '_plans', {})
+
+    def normalizePlan(plan):
+        raise AssertionError('plan normalized again')
+
+    monkeypatch.setattr(recipes, 'normalizePlan', normalizePlan)
+    plan, firstStep = recipes._loadPlan(path)
+
+    assert plan == PLAN
+    assert firstStep.next.done
+
+
+def test_corrupt_cache_is_rebuilt(recipeDir):
+    path, cachePath = writeRecipe(recipeDir, 'test.json', PLAN)
+    cachePath.parent.mkdir()
+    cachePath.write_bytes(b'not a pickle')
+
+    plan, firstStep = recipes._loadPlan(path)
+
+    assert firstStep.next.done
+    cachedPlan, steps = pickle.loads(cachePath.read_bytes())
+    assert cachedPlan == PLAN
+    assert len(steps) == 2
+
+
+def test_invalid_plan_cached_without_steps(recipeDir):
+    invalid = {'title': 'invalid', 'steps': [{'nr': 0, 'done': True}]}
+    path, cachePath = writeRecipe(recipeDir, 'invalid.json', invalid)
+
+    assert recipes._loadPlan(path) == (invalid, None)
+    assert pickle.loads(cachePath.read_bytes()) == (invalid, None)
+
+    assert recipes.start('invalid') == (False, 'Recipe invalid: Step 0 has no message')
+    assert state.currentRecipe is None
+
+
+@pytest.mark.parametrize('plan', [
+    {'title': 'invalid'},
+    {'title': 'invalid', 'steps': ['oops']},
+    ['oops'],
+])
+def test_invalid_plan_does_not_break_list(recipeDir, plan):
+    writeRecipe(recipeDir, 'test.json', PLAN)
+    writeRecipe(recipeDir, 'invalid.json', plan)
+
+    assert PLAN in recipes.getRecipeList()
+    assert recipes.start('invalid')[0] is False
@@ -0,0 +1,44 @@
+import threading
+import pytest
+from recipes import base
+
+
+PLAN = {
+    'title': 'test',
+    'steps': [
+        {'nr': 0, 'message': 'Waiting', 'next': 1},
+        {'nr': 1, 'message': 'Done', 'done': True},
+    ],
+}
+
+
+class UnreachableTask:
+    """
+    Celery result whose backend can't be reached.
+    """
+
+    def ready(self):
+        raise ConnectionError('result backend unreachable')
+
+    def failed(self):
+        raise ConnectionError('result backend unreachable')
+
+    def revoke(self, terminate=False):
+        pass
+
+
+def test_update_status_error_releases_mutex():
+    recipe = base.Recipe(PLAN)
+    recipe.status = 'running'
+    recipe.currentTasks = [UnreachableTask()]
+
+    with pytest.raises(ConnectionError):
+        recipe.updateStatus(force=True)
+
+    # The recipe has to stay stoppable from any other request.
+    stopper = threading.Thread(target=recipe.stop, daemon=True)
+    stopper.start()
+    stopper.join(2)
+    assert not stopper.is_alive()
+    assert recipe.status == 'idle'
+    assert recipe.currentTasks == []
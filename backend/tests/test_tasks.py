@@ -0,0 +1,32 @@
+import pytest
+from recipes import tasks
+
+
+LOW = 98
+HIGH = 102
+
+
+@pytest.mark.parametrize('temp,rate,expected', [
+    # Inside the tolerance band, the time until the edge it is moving towards.
+    (100, 1, 2.0),
+    (100, -0.5, 4.0),
+    (100, 0, tasks.MAINTAIN_MAX_INTERVAL),
+    (HIGH, 0, tasks.MAINTAIN_MAX_INTERVAL),
+    (101.99, 1, tasks.MAINTAIN_MIN_INTERVAL),
+    (98.01, -1, tasks.MAINTAIN_MIN_INTERVAL),
+    (100, 0.1, tasks.MAINTAIN_MAX_INTERVAL),
+    # Below the band, the time until it gets back into the band.
+    (90, 4, 2.0),
+    (97.9, 10, tasks.MAINTAIN_DEFAULT_INTERVAL),
+    (50, 1, tasks.MAINTAIN_MAX_INTERVAL),
+    (90, 0, tasks.MAINTAIN_DEFAULT_INTERVAL),
+    (90, -1, tasks.MAINTAIN_DEFAULT_INTERVAL),
+    # Above the band.
+    (110, -4, 2.0),
+    (102.1, -10, tasks.MAINTAIN_DEFAULT_INTERVAL),
+    (150, -1, tasks.MAINTAIN_MAX_INTERVAL),
+    (110, 0, tasks.MAINTAIN_DEFAULT_INTERVAL),
+    (110, 1, tasks.MAINTAIN_DEFAULT_INTERVAL),
+])
+def test_maintain_interval(temp, rate, expected):
+    assert tasks._maintainInterval(temp, rate, LOW, HIGH) == pytest.approx(expected)